@@ -1,7 +1,20 @@
-from .llamapay import Factory, Pool, Stream
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .llamapay import Factory, Pool, Stream
 
 __all__ = [
     "Factory",
     "Pool",
     "Stream",
 ]
+
+
+def __getattr__(name):
+    # importing ape is slow, defer it until the sdk is actually used
+    if name in __all__:
+        from . import llamapay
+
+        return getattr(llamapay, name)
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
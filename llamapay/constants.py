@@ -1,10 +1,12 @@
 import pkgutil
-from datetime import timedelta
 from typing import List
 
+from eth_utils import keccak
 from ethpm_types import PackageManifest
 from pydantic import BaseModel
 
+from llamapay.rates import DURATION_TO_SECONDS, PRECISION, RATE_PATTERN  # noqa: F401
+
 manifest = pkgutil.get_data(__package__, "manifest.json")
 CONTRACT_TYPES = PackageManifest.parse_raw(manifest).contract_types  # type: ignore
 
@@ -104,14 +106,37 @@ FACTORY_DEPLOYMENTS = Deplyoments(
 )
 
 
-DURATION_TO_SECONDS = {
-    period: int(timedelta(days=days).total_seconds())
-    for period, days in [
-        ("day", 1),
-        ("week", 7),
-        ("month", 30),
-        ("year", 365.2425),
-    ]
-}
+# block range per eth_getLogs request, adjusted based on response time
+LOGS_PAGE_SIZE = 2_000
+LOGS_PAGE_SIZE_MIN = 200
+LOGS_PAGE_SIZE_MAX = 10_000
+# max eth_getLogs requests in a single JSON-RPC batch
+LOGS_BATCH_SIZE = 20
+# max calls in a single Multicall3 request, to stay under the eth_call gas cap
+MULTICALL_CHUNK_SIZE = 500
+# seconds, same as the web3 http provider default
+RPC_BATCH_TIMEOUT = 10
+# retries of a rate limited or failed JSON-RPC batch, waiting 1, 2, 4 seconds in between
+RPC_BATCH_RETRIES = 3
+RPC_BATCH_BACKOFF = 1
+# blocks synced between writes of the streams cache
+CACHE_SAVE_INTERVAL = 100_000
+# recent blocks of the streams cache which are synced again on load, in case of a reorg
+CACHE_CONFIRMATIONS = 128
+# up to this many new blocks are checked with bloom filters before requesting logs
+BLOOM_CHECK_BLOCKS = 16
 
-PRECISION = 10**20
+# topic0 -> (topic index of the target, data word of the rate)
+# events which start a stream
+STREAM_STARTED_TOPICS = {
+    keccak(text="StreamCreated(address,address,uint216,bytes32)"): (2, 0),
+    keccak(text="StreamCreatedWithReason(address,address,uint216,bytes32,string)"): (2, 0),
+    keccak(text="StreamModified(address,address,uint216,bytes32,address,uint216,bytes32)"): (3, 2),
+}
+# events which stop a stream, for a modification it's the old stream
+STREAM_STOPPED_TOPICS = {
+    keccak(text="StreamCancelled(address,address,uint216,bytes32)"): (2, 0),
+    keccak(text="StreamPaused(address,address,uint216,bytes32)"): (2, 0),
+    keccak(text="StreamModified(address,address,uint216,bytes32,address,uint216,bytes32)"): (2, 0),
+}
+STREAM_EVENT_TOPICS = list({**STREAM_STOPPED_TOPICS, **STREAM_STARTED_TOPICS})
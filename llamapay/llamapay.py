@@ -1,18 +1,48 @@
+import json
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from decimal import Decimal
-from functools import cached_property
-from typing import List, Optional, Union
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
 from ape.api import ReceiptAPI
-from ape.types import AddressType, ContractLog
+from ape.api.networks import LOCAL_NETWORK_NAME
+from ape.exceptions import ContractLogicError, ProviderError
+from ape.logging import logger
+from ape.types import AddressType
 from ape.utils import ManagerAccessMixin
 from ape_tokens import tokens
 from ape_tokens.managers import ERC20
-from eth_abi.packed import encode_abi_packed
-from eth_utils import keccak
-
-from llamapay.constants import CONTRACT_TYPES, DURATION_TO_SECONDS, FACTORY_DEPLOYMENTS, PRECISION
+from eth_utils import keccak, to_checksum_address
+from hexbytes import HexBytes
+
+from llamapay.constants import (
+    BLOOM_CHECK_BLOCKS,
+    CACHE_CONFIRMATIONS,
+    CACHE_SAVE_INTERVAL,
+    CONTRACT_TYPES,
+    FACTORY_DEPLOYMENTS,
+    LOGS_BATCH_SIZE,
+    LOGS_PAGE_SIZE,
+    LOGS_PAGE_SIZE_MAX,
+    LOGS_PAGE_SIZE_MIN,
+    STREAM_EVENT_TOPICS,
+    STREAM_STARTED_TOPICS,
+    STREAM_STOPPED_TOPICS,
+)
 from llamapay.exceptions import PoolNotDeployed
+from llamapay.rates import convert_rate
+from llamapay.utils import (
+    batch_call,
+    batch_transact,
+    bloom_contains,
+    cached_property,
+    parse_quantity,
+    rpc_batch,
+)
 
 
 class Factory(ManagerAccessMixin):
@@ -41,6 +71,20 @@ class Factory(ManagerAccessMixin):
 
         return Pool(address, factory=self)
 
+    def get_pools(self, token_list: List[str]) -> List["Pool"]:
+        """
+        Get pools by token addresses or symbols, resolving them in a single multicall.
+        """
+        addresses = [self._resolve_token(token) for token in token_list]
+        results = batch_call(
+            [(self.contract.getLlamaPayContractByToken, token) for token in addresses]
+        )
+        for address, is_deployed in results:
+            if not is_deployed:
+                raise PoolNotDeployed("deterministic address: %s" % address)
+
+        return self._make_pools([address for address, _ in results])
+
     def create_pool(self, token: str, **tx_args) -> "Pool":
         """
         Create a pool for a token and return it.
@@ -72,13 +116,29 @@ class Factory(ManagerAccessMixin):
         """
         Get all pools deployed by a factory.
         """
-        # TODO update to use multicall
         pool_count = self.contract.getLlamaPayContractCount()
-        pools = [
-            Pool(self.contract.getLlamaPayContractByIndex(i), factory=self)
-            for i in range(pool_count)
+        addresses = batch_call(
+            [(self.contract.getLlamaPayContractByIndex, i) for i in range(pool_count)]
+        )
+        return self._make_pools(addresses)
+
+    def _make_pools(self, addresses: List[AddressType]) -> List["Pool"]:
+        """
+        Create pools, fetching their tokens and token decimals in one multicall each.
+        """
+        contracts = [
+            self.create_contract(address, CONTRACT_TYPES["LlamaPay"])  # type: ignore
+            for address in addresses
+        ]
+        token_addresses = batch_call([(contract.token,) for contract in contracts])
+        token_contracts = [self.create_contract(token, ERC20) for token in token_addresses]
+        decimals = batch_call([(token.decimals,) for token in token_contracts])
+        # fall back to 18 for tokens which don't implement decimals
+        decimals = [18 if token_decimals is None else token_decimals for token_decimals in decimals]
+        return [
+            Pool(address, factory=self, token=token, decimals=token_decimals)
+            for address, token, token_decimals in zip(addresses, token_addresses, decimals)
         ]
-        return pools
 
     def _resolve_token(self, token: str) -> AddressType:
         """
@@ -97,64 +157,381 @@ class Pool(ManagerAccessMixin):
     A pool handles all streams for a specific token.
     """
 
-    def __init__(self, address: AddressType, factory: Factory):
+    def __init__(
+        self,
+        address: AddressType,
+        factory: Factory,
+        token: Optional[AddressType] = None,
+        decimals: Optional[int] = None,
+    ):
         self.address = address
         self.factory = factory
         self.contract = self.create_contract(
             self.address,
             CONTRACT_TYPES["LlamaPay"],  # type: ignore
         )
-        self.token = self.create_contract(self.contract.token(), ERC20)
+        self.token = self.create_contract(token or self.contract.token(), ERC20)
+        if decimals is None:
+            try:
+                decimals = self.token.decimals()
+            except ContractLogicError:
+                # fall back to 18 for tokens which don't implement decimals
+                decimals = 18
+        self.decimals = decimals
+        self.scale = 10**self.decimals
         # cache
-        self._logs: List[ContractLog] = []
         self._last_logs_block = self.factory.deployment.deploy_block
-        self._streams: List["Stream"] = []
+        self._logs_page_size = LOGS_PAGE_SIZE
+        self._batch_logs = True
+        # streams are stored as columns and only turned into `Stream` instances when requested
+        self._sources: List[AddressType] = []
+        self._targets: List[AddressType] = []
+        self._rates: List[int] = []
+        # (block number, log index) of the event which started the stream
+        self._positions: List[Tuple[int, int]] = []
+        # address -> row indices
+        self._by_source: Dict[AddressType, List[int]] = {}
+        self._by_target: Dict[AddressType, List[int]] = {}
+        # (source, target, rate) of streams which haven't been cancelled, paused or modified
+        self._active: Set[Tuple[AddressType, AddressType, int]] = set()
+        # (block number, log index, source, target, rate) of the events which stopped a stream
+        self._stops: List[Tuple[int, int, AddressType, AddressType, int]] = []
+        self._load_cache()
+        self._saved_logs_block = self._last_logs_block
 
     @cached_property
     def symbol(self):
         return self.token.symbol()
 
-    @cached_property
-    def scale(self):
-        return 10 ** self.token.decimals()
-
     @cached_property
     def internal_scale(self):
         return self.contract.DECIMALS_DIVISOR()
 
     def _refresh_logs(self):
-        start = self._last_logs_block
+        """
+        Fetch new logs in block windows, doubling the window when responses are fast
+        and halving it when they are slow. Progress is kept after each window.
+        Windows are sent in JSON-RPC batches when the provider supports them,
+        and a few new blocks are first narrowed down by their bloom filters.
+        """
         head = self.chain_manager.blocks.height
-        if start >= head:
+        if self._last_logs_block > head:
             return
 
-        logs = list(
-            self.provider.get_contract_logs(
-                self.address,
-                self.contract.contract_type.events,
-                start_block=start,
-                stop_block=head,
-                block_page_size=10_000,
+        # keep the progress even if the sync is interrupted
+        try:
+            if self._batch_logs and head - self._last_logs_block < BLOOM_CHECK_BLOCKS:
+                if self._refresh_logs_bloom(head):
+                    return
+
+            if self._batch_logs:
+                self._refresh_logs_batched(head)
+
+            with ThreadPoolExecutor(max_workers=len(STREAM_EVENT_TOPICS)) as executor:
+                while self._last_logs_block <= head:
+                    start = self._last_logs_block
+                    stop = min(start + self._logs_page_size - 1, head)
+                    started = time.monotonic()
+                    logs = self._get_logs(executor, start, stop)
+                    self._adjust_page_size(time.monotonic() - started)
+                    self._process_logs(logs)
+                    self._last_logs_block = stop + 1
+                    self._save_cache(periodic=True)
+        finally:
+            self._save_cache()
+
+    def _refresh_logs_batched(self, head: int):
+        """
+        Send multiple windows in a single JSON-RPC batch request. Windows which fail,
+        usually with too many results, are retried with a halved window.
+        """
+        while self._last_logs_block <= head:
+            windows = []
+            start = self._last_logs_block
+            while start <= head and len(windows) < LOGS_BATCH_SIZE // len(STREAM_EVENT_TOPICS):
+                stop = min(start + self._logs_page_size - 1, head)
+                windows.append((start, stop))
+                start = stop + 1
+
+            started = time.monotonic()
+            results = self._get_logs_batched(windows)
+            if results is None:
+                return
+
+            for (start, stop), logs in zip(windows, results):
+                if logs is None:
+                    if self._logs_page_size == LOGS_PAGE_SIZE_MIN:
+                        raise ProviderError(f"eth_getLogs failed for blocks {start}-{stop}")
+                    self._logs_page_size = max(self._logs_page_size // 2, LOGS_PAGE_SIZE_MIN)
+                    break
+
+                self._process_logs(logs)
+                self._last_logs_block = stop + 1
+            else:
+                self._adjust_page_size(time.monotonic() - started)
+
+            self._save_cache(periodic=True)
+
+    def _get_logs_batched(
+        self, windows: List[Tuple[int, int]]
+    ) -> Optional[List[Optional[List[dict]]]]:
+        """
+        Fetch logs for multiple windows in a single JSON-RPC batch, one request per stream event.
+        Returns logs of each window in chain order, or `None` for windows which failed.
+        Returns `None` and disables batching if the provider doesn't support batch requests
+        or keeps failing them, leaving the sync to the sequential requests.
+        """
+        topics = ["0x" + topic.hex() for topic in STREAM_EVENT_TOPICS]
+        calls = [
+            (
+                "eth_getLogs",
+                [
+                    {
+                        "address": self.address,
+                        "fromBlock": hex(start),
+                        "toBlock": hex(stop),
+                        "topics": [topic],
+                    }
+                ],
             )
-        )
+            for start, stop in windows
+            for topic in topics
+        ]
+        results = rpc_batch(self.provider.web3.provider, calls)
+        if results is None:
+            self._batch_logs = False
+            return None
+
+        window_logs: List[Optional[List[dict]]] = []
+        for i in range(len(windows)):
+            items = [results.get(i * len(topics) + j) for j in range(len(topics))]
+            if any(item is None or "result" not in item for item in items):
+                window_logs.append(None)
+                continue
+
+            logs = [log for item in items for log in item["result"]]  # type: ignore
+            logs.sort(key=lambda log: (int(log["blockNumber"], 16), int(log["logIndex"], 16)))
+            window_logs.append(logs)
+
+        return window_logs
+
+    def _adjust_page_size(self, elapsed: float):
+        if elapsed < 1:
+            self._logs_page_size = min(self._logs_page_size * 2, LOGS_PAGE_SIZE_MAX)
+        elif elapsed > 5:
+            self._logs_page_size = max(self._logs_page_size // 2, LOGS_PAGE_SIZE_MIN)
+
+    def _refresh_logs_bloom(self, head: int) -> bool:
+        """
+        Fetch the bloom filters of a few new blocks in one batch request and only request logs
+        for the runs of blocks which may contain stream events, in batches of the usual size.
+        Returns `False` if it couldn't complete, leaving the rest to the regular sync.
+        """
+        windows = self._bloom_windows(self._last_logs_block, head)
+        if windows is None:
+            return False
+
+        group_size = LOGS_BATCH_SIZE // len(STREAM_EVENT_TOPICS)
+        for i in range(0, len(windows), group_size):
+            group = windows[i : i + group_size]
+            results = self._get_logs_batched(group)
+            if results is None or any(logs is None for logs in results):
+                # the blocks before this group's first candidate are already synced or ruled out
+                self._last_logs_block = group[0][0]
+                return False
+
+            for logs in results:
+                self._process_logs(logs)  # type: ignore
+
         self._last_logs_block = head + 1
-        self._logs.extend(logs)
+        return True
+
+    def _bloom_windows(self, start: int, stop: int) -> Optional[List[Tuple[int, int]]]:
+        """
+        Narrow down a block range to runs of blocks whose bloom filters may contain stream events.
+        Returns `None` if the block headers couldn't be fetched in a batch request,
+        also disabling batching if the provider doesn't support it or keeps failing.
+        """
+        blocks = range(start, stop + 1)
+        calls = [("eth_getBlockByNumber", [hex(block), False]) for block in blocks]
+        results = rpc_batch(self.provider.web3.provider, calls)
+        if results is None:
+            self._batch_logs = False
+            return None
+
+        windows: List[Tuple[int, int]] = []
+        for i, block in enumerate(blocks):
+            item = results.get(i)
+            if item is None or not item.get("result"):
+                return None
+            if not self._bloom_matches(HexBytes(item["result"]["logsBloom"])):
+                continue
+            if windows and windows[-1][1] == block - 1:
+                windows[-1] = (windows[-1][0], block)
+            else:
+                windows.append((block, block))
+
+        return windows
+
+    def _bloom_matches(self, bloom: bytes) -> bool:
+        return bloom_contains(bloom, bytes.fromhex(self.address[2:])) and any(
+            bloom_contains(bloom, topic) for topic in STREAM_EVENT_TOPICS
+        )
+
+    def _get_logs(self, executor, start: int, stop: int) -> List[dict]:
+        """
+        Fetch raw logs with a separate filter for each stream event, since nodes handle single
+        topic filters much better. The requests run concurrently and are merged in chain order.
+        """
+
+        def get_event_logs(topic):
+            return self.provider.web3.eth.get_logs(
+                {
+                    "address": self.address,
+                    "fromBlock": start,
+                    "toBlock": stop,
+                    "topics": ["0x" + topic.hex()],
+                }
+            )
+
+        logs = [
+            log
+            for event_logs in executor.map(get_event_logs, STREAM_EVENT_TOPICS)
+            for log in event_logs
+        ]
+        return sorted(logs, key=lambda log: (log["blockNumber"], log["logIndex"]))
 
+    def _process_logs(self, logs: List[dict]):
+        """
+        Decode stream events directly from raw logs, skipping the full event decoding.
+        Accepts both web3 formatted logs and raw JSON-RPC logs.
+        """
         for log in logs:
-            if log.name in ["StreamCreated", "StreamCreatedWithReason", "StreamModified"]:
-                self._streams.append(
-                    Stream(
-                        source=log.event_arguments["from"],
-                        target=log.to,
-                        rate=log.amountPerSec,
-                        pool=self,
-                    )
+            topics = [HexBytes(topic) for topic in log["topics"]]
+            data = HexBytes(log["data"])
+            event = bytes(topics[0])
+            position = (parse_quantity(log["blockNumber"]), parse_quantity(log["logIndex"]))
+            # a modification stops the old stream and starts a new one
+            if event in STREAM_STOPPED_TOPICS:
+                stream = decode_stream(topics, data, STREAM_STOPPED_TOPICS[event])
+                self._stop_stream(position, *stream)
+            if event in STREAM_STARTED_TOPICS:
+                stream = decode_stream(topics, data, STREAM_STARTED_TOPICS[event])
+                self._start_stream(position, *stream)
+
+    def _start_stream(
+        self, position: Tuple[int, int], source: AddressType, target: AddressType, rate: int
+    ):
+        row = len(self._rates)
+        self._sources.append(source)
+        self._targets.append(target)
+        self._rates.append(rate)
+        self._positions.append(position)
+        self._by_source.setdefault(source, []).append(row)
+        self._by_target.setdefault(target, []).append(row)
+        self._active.add((source, target, rate))
+
+    def _stop_stream(
+        self, position: Tuple[int, int], source: AddressType, target: AddressType, rate: int
+    ):
+        self._stops.append((*position, source, target, rate))
+        self._active.discard((source, target, rate))
+
+    def _get_stream(self, row: int) -> "Stream":
+        return Stream(self._sources[row], self._targets[row], self._rates[row], self)
+
+    @property
+    def _cache_path(self) -> Optional[Path]:
+        """
+        Location of the synced streams cache, not used on local and forked networks
+        since their state diverges from the real chain.
+        """
+        network = self.provider.network
+        if network.name == LOCAL_NETWORK_NAME or network.name.endswith("-fork"):
+            return None
+
+        return (
+            self.config_manager.DATA_FOLDER
+            / "llamapay"
+            / str(self.provider.chain_id)
+            / f"{self.address}.json"
+        )
+
+    def _load_cache(self):
+        path = self._cache_path
+        if path is None or not path.exists():
+            return
+
+        try:
+            cache = json.loads(path.read_text())
+            last_block = int(cache["last_block"])
+            # (block, log index, stops before starts within a log, stream)
+            events = [
+                (int(block), int(index), 1, (source, target, int(rate)))
+                for block, index, source, target, rate in cache["started"]
+            ] + [
+                (int(block), int(index), 0, (source, target, int(rate)))
+                for block, index, source, target, rate in cache["stopped"]
+            ]
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            logger.warning(f"ignoring invalid streams cache {path}: {error}")
+            return
+
+        # the most recent blocks could have been reorganized since, so they are synced again
+        confirmed_block = last_block - CACHE_CONFIRMATIONS
+        for block, index, started, stream in sorted(events):
+            if block > confirmed_block:
+                break
+            if started:
+                self._start_stream((block, index), *stream)
+            else:
+                self._stop_stream((block, index), *stream)
+        self._last_logs_block = max(confirmed_block + 1, self._last_logs_block)
+
+    def _save_cache(self, periodic: bool = False):
+        """
+        Write the synced stream events to disk. Periodic saves during a sync are spaced out by
+        `CACHE_SAVE_INTERVAL` blocks since each one rewrites the whole cache.
+        Events keep their block number, so unconfirmed ones can be dropped when loading.
+        """
+        path = self._cache_path
+        synced_blocks = self._last_logs_block - self._saved_logs_block
+        if path is None or synced_blocks == 0:
+            return
+        if periodic and synced_blocks < CACHE_SAVE_INTERVAL:
+            return
+
+        cache = {
+            "last_block": self._last_logs_block - 1,
+            "started": [
+                [*position, source, target, rate]
+                for position, source, target, rate in zip(
+                    self._positions, self._sources, self._targets, self._rates
                 )
+            ],
+            "stopped": [list(stop) for stop in self._stops],
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # write to a unique temporary file first, so neither an interrupted write
+        # nor another process syncing the same pool can leave a corrupt cache
+        with tempfile.NamedTemporaryFile(
+            "w", dir=path.parent, suffix=".tmp", delete=False
+        ) as temp_file:
+            json.dump(cache, temp_file)
+        Path(temp_file.name).replace(path)
+        self._saved_logs_block = self._last_logs_block
 
     @property
     def all_streams(self) -> List["Stream"]:
+        return list(self.iter_streams())
+
+    def iter_streams(self) -> Iterator["Stream"]:
+        """
+        Iterate over all streams, creating them one at a time.
+        """
         self._refresh_logs()
-        return self._streams[:]
+        for row in range(len(self._rates)):
+            yield self._get_stream(row)
 
     def find_streams(
         self,
@@ -167,18 +544,79 @@ class Pool(ManagerAccessMixin):
             source = self.conversion_manager.convert(source, AddressType)
         if target:
             target = self.conversion_manager.convert(target, AddressType)
-        # source & target
-        if source and target:
-            return [s for s in self.all_streams if s.source == source and s.target == target]
-        elif source:
-            return [s for s in self.all_streams if s.source == source]
-        elif target:
-            return [s for s in self.all_streams if s.target == target]
-        else:
+        if not (source or target):
             raise ValueError("must specify source or target")
 
+        self._refresh_logs()
+        by_source = self._by_source.get(source, []) if source else None
+        by_target = self._by_target.get(target, []) if target else None
+        # source & target, filter the smaller index
+        if by_source is not None and by_target is not None:
+            if len(by_source) <= len(by_target):
+                rows = [row for row in by_source if self._targets[row] == target]
+            else:
+                rows = [row for row in by_target if self._sources[row] == source]
+        elif by_source is not None:
+            rows = by_source
+        else:
+            rows = by_target  # type: ignore
+
+        return [self._get_stream(row) for row in rows]
+
+    def total_rate_by_source(self) -> Dict[AddressType, int]:
+        """
+        Outflow of each source, the sum of rates of its active streams.
+        Cancelled, paused and modified streams are not counted.
+        """
+        self._refresh_logs()
+        return self._sum_rates(0)
+
+    def total_rate_by_target(self) -> Dict[AddressType, int]:
+        """
+        Inflow of each target, the sum of rates of its active streams.
+        Cancelled, paused and modified streams are not counted.
+        """
+        self._refresh_logs()
+        return self._sum_rates(1)
+
+    def _sum_rates(self, key_index: int) -> Dict[AddressType, int]:
+        totals: Dict[AddressType, int] = defaultdict(int)
+        for stream in self._active:
+            totals[stream[key_index]] += stream[2]
+        return dict(totals)
+
     def get_balance(self, source: AddressType) -> Decimal:
-        return Decimal(self.contract.getPayerBalance(source)) / self.scale
+        return self._to_decimal(self.get_balance_raw(source))
+
+    def get_balance_raw(self, source: AddressType) -> int:
+        """
+        Payer balance in token wei.
+        """
+        return self.contract.getPayerBalance(source)
+
+    def get_all_balances(self, payers: Iterable[AddressType]) -> Dict[AddressType, Decimal]:
+        """
+        Get balances of multiple payers in a single multicall.
+        """
+        payers = [self.conversion_manager.convert(payer, AddressType) for payer in payers]
+        results = batch_call([(self.contract.getPayerBalance, payer) for payer in payers])
+        return {payer: self._to_decimal(result) for payer, result in zip(payers, results)}
+
+    def get_all_withdrawable(self) -> Dict[bytes, Decimal]:
+        """
+        Get withdrawable balances of all active streams in multicalls, keyed by stream id.
+        Streams which no longer exist are skipped.
+        """
+        self._refresh_logs()
+        streams = list(self._active)
+        results = batch_call([(self.contract.withdrawable, *stream) for stream in streams])
+        withdrawable = {}
+        for stream, result in zip(streams, results):
+            if result is None:
+                continue
+            withdrawable[get_stream_id(*stream)] = self._to_decimal(result[0])
+
+        return withdrawable
 
     def approve(self, amount=None, **tx_args) -> ReceiptAPI:
         """
@@ -228,6 +666,19 @@ class Pool(ManagerAccessMixin):
         rate = convert_rate(rate)
         return Stream(source, target, rate, self)
 
+    def send_many(self, streams: Iterable["Stream"], **tx_args) -> List[ReceiptAPI]:
+        """
+        Push the pending withdrawal amounts of many streams in a single Multicall3 transaction.
+        A stream which can't be withdrawn from doesn't revert the others. Can be called by anyone.
+        """
+        return batch_transact(
+            [
+                (self.contract.withdraw, stream.source, stream.target, stream.rate)
+                for stream in streams
+            ],
+            **tx_args,
+        )
+
     def _convert_amount(self, amount: Union[None, int, Decimal, str]) -> int:
         """
         None -> max_uint
@@ -246,6 +697,12 @@ class Pool(ManagerAccessMixin):
 
         raise TypeError("invalid amount")
 
+    def _to_decimal(self, amount: int) -> Decimal:
+        """
+        Convert token wei to a decimal amount, shifting the exponent instead of dividing.
+        """
+        return Decimal(amount).scaleb(-self.decimals)
+
     def __repr__(self):
         return f"<Pool address={self.address} token={self.symbol}>"
 
@@ -255,29 +712,29 @@ class Pool(ManagerAccessMixin):
 
 
 @dataclass
-class Stream(ManagerAccessMixin):
+class Stream:
     """
     Represents a payment stream.
     """
 
+    __slots__ = ("source", "target", "rate", "pool", "_id")
+
     source: str
     target: str
     rate: int  # rate in tokens per second, scaled to 1e20, doesn't depend of token decimals
     pool: Pool
 
     def __post_init__(self):
-        self.source = self.conversion_manager.convert(self.source, AddressType)
-        self.target = self.conversion_manager.convert(self.target, AddressType)
+        self.source = self.pool.conversion_manager.convert(self.source, AddressType)
+        self.target = self.pool.conversion_manager.convert(self.target, AddressType)
         self.rate = convert_rate(self.rate)
+        self._id: Optional[bytes] = None
 
     @property
     def id(self) -> bytes:
-        return keccak(
-            encode_abi_packed(
-                ["address", "address", "uint216"],
-                [self.source, self.target, self.rate],
-            )
-        )
+        if self._id is None:
+            self._id = get_stream_id(self.source, self.target, self.rate)
+        return self._id
 
     def create(self, **tx_args):
         assert tx_args["sender"] == self.source, f"sender must be {self.source}"
@@ -317,21 +774,23 @@ class Stream(ManagerAccessMixin):
         Withdrawable balance of a stream.
         """
         result = self.pool.contract.withdrawable(self.source, self.target, self.rate)
-        return Decimal(result.withdrawableAmount) / self.pool.scale
+        return self.pool._to_decimal(result.withdrawableAmount)
 
 
-def convert_rate(rate):
-    if isinstance(rate, int):
-        return rate
-    if isinstance(rate, str):
-        amount, period = rate.split("/")
-        assert period in DURATION_TO_SECONDS, "invalid period"
-        try:
-            amount, _ = amount.split(maxsplit=2)
-        except ValueError:
-            amount, _ = amount, None
+def decode_stream(
+    topics: List[bytes], data: bytes, layout: Tuple[int, int]
+) -> Tuple[AddressType, AddressType, int]:
+    """
+    Decode (source, target, rate) from the raw topics and data of a stream event.
+    """
+    target_index, rate_word = layout
+    return (
+        to_checksum_address(topics[1][-20:]),
+        to_checksum_address(topics[target_index][-20:]),
+        int.from_bytes(data[rate_word * 32 : (rate_word + 1) * 32], "big"),
+    )
 
-        amount = Decimal(amount.replace(",", "_"))
-        return int(amount * PRECISION / DURATION_TO_SECONDS[period])
 
-    raise ValueError("invalid rate")
+def get_stream_id(source: AddressType, target: AddressType, rate: int) -> bytes:
+    # abi.encodePacked(address, address, uint216)
+    return keccak(bytes.fromhex(source[2:]) + bytes.fromhex(target[2:]) + rate.to_bytes(27, "big"))
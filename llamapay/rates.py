@@ -0,0 +1,37 @@
+import re
+from datetime import timedelta
+from decimal import Decimal
+
+# kept free of ape and web3 imports, so rates can be parsed without loading them
+
+DURATION_TO_SECONDS = {
+    period: int(timedelta(days=days).total_seconds())
+    for period, days in [
+        ("day", 1),
+        ("week", 7),
+        ("month", 30),
+        ("year", 365.2425),
+    ]
+}
+
+PRECISION = 10**20
+
+# "<amount> [token]/<period>", e.g. "1 YFI/week", "200,000 UNI/year" or "1e18/month"
+RATE_PATTERN = re.compile(
+    r"\s*(?P<amount>[\d_,.]+(?:[eE][+-]?\d+)?)(?:\s+(?P<token>[^\s/]+))?"
+    r"\s*/\s*(?P<period>%s)\s*$" % "|".join(DURATION_TO_SECONDS)
+)
+
+
+def convert_rate(rate):
+    if isinstance(rate, int):
+        return rate
+    if isinstance(rate, str):
+        match = RATE_PATTERN.match(rate)
+        if match is None:
+            raise ValueError("invalid rate")
+
+        amount = Decimal(match["amount"].replace(",", "_"))
+        return int(amount * PRECISION) // DURATION_TO_SECONDS[match["period"]]
+
+    raise ValueError("invalid rate")
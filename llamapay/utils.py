@@ -0,0 +1,159 @@
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import requests
+from ape.api import ReceiptAPI
+from ape.exceptions import ContractLogicError
+from eth_utils import keccak
+from web3 import HTTPProvider
+
+from llamapay.constants import (
+    MULTICALL_CHUNK_SIZE,
+    RPC_BATCH_BACKOFF,
+    RPC_BATCH_RETRIES,
+    RPC_BATCH_TIMEOUT,
+)
+
+try:
+    from ape_ethereum import multicall
+    from ape_ethereum.multicall.exceptions import UnsupportedChainError
+except ImportError:  # ape version without multicall support
+    multicall = None  # type: ignore
+
+# reuse connections between batch requests
+_session = requests.Session()
+
+
+class cached_property:
+    """
+    Compute a value once and store it on the instance, so later lookups bypass the descriptor.
+    Unlike `functools.cached_property` it takes no lock.
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.name = func.__name__
+        self.__doc__ = func.__doc__
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        value = instance.__dict__[self.name] = self.func(instance)
+        return value
+
+
+def bloom_contains(bloom: bytes, value: bytes) -> bool:
+    """
+    Check if a value, such as an address or a topic, may be present in a block logs bloom filter.
+    """
+    bits = int.from_bytes(bloom, "big")
+    digest = keccak(value)
+    return all(bits >> (int.from_bytes(digest[i : i + 2], "big") & 2047) & 1 for i in (0, 2, 4))
+
+
+def parse_quantity(value: Union[int, str]) -> int:
+    """
+    Parse a hex encoded JSON-RPC quantity, values already formatted by web3 are passed through.
+    """
+    return int(value, 16) if isinstance(value, str) else value
+
+
+def rpc_batch(provider, calls: Sequence[Tuple[str, list]]) -> Optional[Dict[int, dict]]:
+    """
+    Send `(method, params)` calls as a single JSON-RPC batch request over HTTP and return
+    the responses keyed by call index. Calls missing from the result should be treated as failed.
+    Rate limited, overloaded or unreachable nodes are retried with an exponential backoff.
+    Returns `None` if the provider doesn't support batch requests or the retries run out.
+    """
+    if not isinstance(provider, HTTPProvider):
+        return None
+
+    batch = [
+        {"jsonrpc": "2.0", "id": i, "method": method, "params": params}
+        for i, (method, params) in enumerate(calls)
+    ]
+    request_kwargs = {"timeout": RPC_BATCH_TIMEOUT, **provider.get_request_kwargs()}
+    for attempt in range(RPC_BATCH_RETRIES + 1):
+        if attempt:
+            time.sleep(RPC_BATCH_BACKOFF * 2 ** (attempt - 1))
+        try:
+            response = _session.post(provider.endpoint_uri, json=batch, **request_kwargs)
+        except requests.RequestException:
+            continue
+        if response.status_code != 429 and response.status_code < 500:
+            break
+    else:
+        return None
+
+    try:
+        items = response.json()
+    except ValueError:
+        return None
+
+    if not response.ok or not isinstance(items, list):
+        return None
+
+    return {item["id"]: item for item in items if isinstance(item, dict) and "id" in item}
+
+
+def batch_call(
+    calls: Sequence[Tuple[Any, ...]], chunk_size: int = MULTICALL_CHUNK_SIZE
+) -> List[Any]:
+    """
+    Execute a sequence of `(method, *args)` view calls in Multicall3 requests of `chunk_size`
+    calls each, keeping every request under the node's eth_call gas cap.
+    Falls back to calling them one by one if Multicall3 is not available on the chain.
+    Results of reverted calls are returned as `None`.
+    """
+    if not calls:
+        return []
+
+    if multicall is not None:
+        try:
+            results = []
+            for i in range(0, len(calls), chunk_size):
+                call = multicall.Call()
+                for method, *args in calls[i : i + chunk_size]:
+                    call.add(method, *args)
+                results.extend(call())
+            return results
+        except UnsupportedChainError:
+            pass
+
+    results = []
+    for method, *args in calls:
+        try:
+            results.append(method(*args))
+        except ContractLogicError:
+            results.append(None)
+
+    return results
+
+
+def batch_transact(calls: Sequence[Tuple[Any, ...]], **tx_args) -> List[ReceiptAPI]:
+    """
+    Send a sequence of `(method, *args)` calls in a single Multicall3 transaction,
+    where a failing call doesn't revert the others.
+    Falls back to one transaction per call if Multicall3 is not available on the chain,
+    skipping the calls which revert.
+    """
+    if not calls:
+        return []
+
+    if multicall is not None:
+        try:
+            tx = multicall.Transaction()
+            for method, *args in calls:
+                tx.add(method, *args, allowFailure=True)
+            return [tx(**tx_args)]
+        except UnsupportedChainError:
+            pass
+
+    receipts = []
+    for method, *args in calls:
+        try:
+            receipts.append(method(*args, **tx_args))
+        except ContractLogicError:
+            pass
+
+    return receipts
@@ -33,3 +33,19 @@ def test_create_pool_non_token(factory, bird, bee):
 
 def test_pools(factory):
     assert len(factory.pools) >= 1
+
+
+def test_factory_get_pools(factory):
+    assert factory.get_pools(["DAI", "USDC"]) == [factory.get_pool("DAI"), factory.get_pool("USDC")]
+
+
+def test_factory_get_pools_not_exists(factory):
+    with pytest.raises(PoolNotDeployed):
+        factory.get_pools(["DAI", "UST"])
+
+
+def test_pools_decimals(factory):
+    pool = factory.get_pool("DAI")
+    (batched,) = [p for p in factory.pools if p == pool]
+    assert batched.decimals == pool.decimals == 18
+    assert batched.token == pool.token
@@ -2,11 +2,32 @@ from decimal import Decimal
 
 import pytest
 
+from llamapay import Pool, utils
+from llamapay.constants import LOGS_BATCH_SIZE, STREAM_EVENT_TOPICS
+from llamapay.utils import batch_call, bloom_contains, rpc_batch
+
+
+class FakeResponse:
+    def __init__(self, status_code, items):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.items = items
+
+    def json(self):
+        if self.items is None:
+            raise ValueError("not json")
+        return self.items
+
 
 def test_pool_get_balance(pool):
     assert pool.get_balance("0xFEB4acf3df3cDEA7399794D0869ef76A6EfAff52") > 0
 
 
+def test_pool_get_balance_raw(pool):
+    payer = "0xFEB4acf3df3cDEA7399794D0869ef76A6EfAff52"
+    assert pool.get_balance_raw(payer) == pool.get_balance(payer) * pool.scale
+
+
 @pytest.mark.parametrize("amount", [10**21, "1000 DAI", Decimal("1000")])
 def test_pool_approve(pool, token, bird, amount):
     wei_amount = 10**21
@@ -56,3 +77,206 @@ def test_pool_create_stream(pool, bird, bee):
 def test_factory_create_stream(factory, bird, bee):
     stream = factory.create_stream(bee, "1000 DAI/month", sender=bird)
     print(stream)
+
+
+def test_pool_get_all_balances(pool):
+    payer = "0xFEB4acf3df3cDEA7399794D0869ef76A6EfAff52"
+    assert pool.get_all_balances([payer]) == {payer: pool.get_balance(payer)}
+
+
+def test_pool_find_streams(pool, bird, bee):
+    stream = pool.make_stream(bird, bee, "1000 DAI/month")
+    stream.create(sender=bird)
+    assert stream in pool.find_streams(source=bird)
+    assert stream in pool.find_streams(target=bee)
+    assert stream in pool.find_streams(source=bird, target=bee)
+    assert stream not in pool.find_streams(source=bee, target=bird)
+
+
+def test_pool_total_rate(pool, accounts):
+    # a fresh payer and targets, unaffected by other tests
+    payer, alice, carol = accounts[2], accounts[3], accounts[4]
+    pool.make_stream(payer, alice, 10**18).create(sender=payer)
+    modified = pool.make_stream(payer, carol, 10**18)
+    modified.create(sender=payer)
+    modified.modify(rate=3 * 10**18, sender=payer)
+    cancelled = pool.make_stream(payer, carol, 5 * 10**18)
+    cancelled.create(sender=payer)
+    cancelled.cancel(sender=payer)
+
+    assert pool.total_rate_by_source()[str(payer)] == 4 * 10**18
+    assert pool.total_rate_by_target()[str(alice)] == 10**18
+    assert pool.total_rate_by_target()[str(carol)] == 3 * 10**18
+
+
+def test_pool_refresh_logs_sequential(pool, accounts, monkeypatch):
+    pool._refresh_logs()
+    # the path used by providers without batch support
+    monkeypatch.setattr(pool, "_batch_logs", False)
+    payer, alice, carol = accounts[5], accounts[6], accounts[7]
+    created = pool.make_stream(payer, alice, 10**18)
+    created.create(sender=payer)
+    modified = pool.make_stream(payer, carol, 10**18)
+    modified.create(sender=payer)
+    modified.modify(rate=3 * 10**18, sender=payer)
+    cancelled = pool.make_stream(payer, carol, 5 * 10**18)
+    cancelled.create(sender=payer)
+    cancelled.cancel(sender=payer)
+
+    streams = pool.find_streams(source=payer)
+    assert created in streams
+    assert pool.make_stream(payer, carol, 3 * 10**18) in streams
+    assert cancelled in streams
+    assert pool.total_rate_by_source()[str(payer)] == 4 * 10**18
+    assert pool.total_rate_by_target()[str(carol)] == 3 * 10**18
+
+
+def test_pool_iter_streams(pool, bird, bee):
+    pool.make_stream(bird, bee, "1000 DAI/month").create(sender=bird)
+    assert list(pool.iter_streams()) == pool.all_streams
+
+
+def test_pool_bloom_contains(pool, bird, bee, chain):
+    receipt = pool.make_stream(bird, bee, "1000 DAI/month").create(sender=bird)
+    bloom = chain.provider.web3.eth.get_block(receipt.block_number)["logsBloom"]
+    assert bloom_contains(bloom, bytes.fromhex(pool.address[2:]))
+    assert any(bloom_contains(bloom, topic) for topic in STREAM_EVENT_TOPICS)
+    # an empty bloom filter contains nothing
+    assert not bloom_contains(bytes(256), bytes.fromhex(pool.address[2:]))
+
+
+def test_pool_refresh_logs_skips_empty_blocks(pool, chain, monkeypatch):
+    pool._refresh_logs()
+    chain.mine(5)
+
+    def get_logs(*args):
+        raise AssertionError("logs requested for blocks without stream events")
+
+    monkeypatch.setattr(pool, "_get_logs", get_logs)
+    monkeypatch.setattr(pool, "_get_logs_batched", get_logs)
+    pool._refresh_logs()
+    assert pool._last_logs_block == chain.blocks.height + 1
+
+
+def test_pool_refresh_logs_bloom_match(pool, bird, bee):
+    pool._refresh_logs()
+    stream = pool.make_stream(bird, bee, "1234 DAI/month")
+    stream.create(sender=bird)
+    assert stream in pool.find_streams(source=bird, target=bee)
+
+
+def test_pool_refresh_logs_bloom_groups(pool, chain, monkeypatch):
+    pool._refresh_logs()
+    chain.mine(10)
+    # every new block is a separate candidate run
+    windows = [(block, block) for block in range(pool._last_logs_block, chain.blocks.height + 1)]
+    monkeypatch.setattr(pool, "_bloom_windows", lambda start, stop: windows)
+    sizes = []
+    get_logs_batched = pool._get_logs_batched
+
+    def record_batch(group):
+        sizes.append(len(group))
+        return get_logs_batched(group)
+
+    monkeypatch.setattr(pool, "_get_logs_batched", record_batch)
+    assert pool._refresh_logs_bloom(chain.blocks.height)
+    assert sum(sizes) == len(windows)
+    assert max(sizes) * len(STREAM_EVENT_TOPICS) <= LOGS_BATCH_SIZE
+
+
+def test_rpc_batch(chain):
+    calls = [("eth_blockNumber", []), ("eth_chainId", [])]
+    results = rpc_batch(chain.provider.web3.provider, calls)
+    assert int(results[0]["result"], 16) >= chain.blocks.height
+    assert int(results[1]["result"], 16) == chain.provider.chain_id
+
+
+def test_batch_call_chunks(pool, bird, bee):
+    calls = [(pool.contract.getPayerBalance, payer) for payer in [bird, bee, bird]]
+    assert batch_call(calls, chunk_size=2) == [method(*args) for method, *args in calls]
+
+
+def test_pool_get_logs_batched_missing_id(pool, monkeypatch):
+    # the node only answers the first request of the window
+    response = FakeResponse(200, [{"jsonrpc": "2.0", "id": 0, "result": []}])
+    monkeypatch.setattr(utils._session, "post", lambda *args, **kwargs: response)
+    assert pool._get_logs_batched([(1, 2)]) == [None]
+
+
+def test_pool_get_logs_batched_overloaded(pool, monkeypatch):
+    response = FakeResponse(503, None)
+    delays = []
+    monkeypatch.setattr(utils._session, "post", lambda *args, **kwargs: response)
+    monkeypatch.setattr(utils.time, "sleep", delays.append)
+    monkeypatch.setattr(pool, "_batch_logs", True)
+    assert pool._get_logs_batched([(1, 2), (3, 4)]) is None
+    assert delays == [1, 2, 4]
+    assert not pool._batch_logs
+
+
+def test_pool_refresh_logs_throttled(pool, bird, bee, monkeypatch):
+    pool._refresh_logs()
+    response = FakeResponse(429, None)
+    monkeypatch.setattr(utils._session, "post", lambda *args, **kwargs: response)
+    monkeypatch.setattr(utils.time, "sleep", lambda delay: None)
+    monkeypatch.setattr(pool, "_batch_logs", True)
+    stream = pool.make_stream(bird, bee, "2345 DAI/month")
+    stream.create(sender=bird)
+    # falls back to sequential requests instead of failing the sync
+    assert stream in pool.find_streams(source=bird, target=bee)
+    assert not pool._batch_logs
+
+
+def test_pool_get_logs_batched_unsupported(pool, monkeypatch):
+    response = FakeResponse(200, {"jsonrpc": "2.0", "id": None, "error": {"message": "no batch"}})
+    monkeypatch.setattr(utils._session, "post", lambda *args, **kwargs: response)
+    assert pool._get_logs_batched([(1, 2)]) is None
+
+
+def test_pool_cache(pool, factory, bird, bee, chain, tmp_path, monkeypatch):
+    path = tmp_path / "pool.json"
+    monkeypatch.setattr(Pool, "_cache_path", property(lambda self: path))
+    monkeypatch.setattr("llamapay.llamapay.CACHE_CONFIRMATIONS", 0)
+    receipt = pool.make_stream(bird, bee, "4321 DAI/month").create(sender=bird)
+
+    synced = Pool(pool.address, factory=factory)
+    # only sync the recent blocks
+    synced._last_logs_block = receipt.block_number
+    synced._refresh_logs()
+    assert path.exists()
+
+    cached = Pool(pool.address, factory=factory)
+    assert cached._last_logs_block == synced._last_logs_block == chain.blocks.height + 1
+    assert cached._rates == synced._rates
+    assert cached._sources == synced._sources
+    assert cached._targets == synced._targets
+    assert cached._positions == synced._positions
+    assert cached._active == synced._active
+    assert cached._stops == synced._stops
+    assert synced.make_stream(bird, bee, "4321 DAI/month") in cached.find_streams(source=bird)
+
+
+def test_pool_cache_unconfirmed(pool, factory, bird, bee, chain, tmp_path, monkeypatch):
+    path = tmp_path / "pool.json"
+    monkeypatch.setattr(Pool, "_cache_path", property(lambda self: path))
+    monkeypatch.setattr("llamapay.llamapay.CACHE_CONFIRMATIONS", 10)
+    receipt = pool.make_stream(bird, bee, "5432 DAI/month").create(sender=bird)
+
+    synced = Pool(pool.address, factory=factory)
+    synced._last_logs_block = receipt.block_number
+    synced._refresh_logs()
+
+    # the stream isn't confirmed yet, so it's only restored by syncing again
+    cached = Pool(pool.address, factory=factory)
+    assert cached._last_logs_block == chain.blocks.height + 1 - 10
+    assert cached._rates == []
+    assert synced.make_stream(bird, bee, "5432 DAI/month") in cached.find_streams(source=bird)
+
+
+def test_pool_cache_corrupt(pool, factory, tmp_path, monkeypatch):
+    path = tmp_path / "pool.json"
+    path.write_text('{"last_block": 1')
+    monkeypatch.setattr(Pool, "_cache_path", property(lambda self: path))
+
+    corrupt = Pool(pool.address, factory=factory)
+    assert corrupt._last_logs_block == factory.deployment.deploy_block
@@ -1,3 +1,30 @@
+import pytest
+
+from llamapay.llamapay import convert_rate
+
+
+@pytest.mark.parametrize(
+    "rate,expected",
+    [
+        (10**18, 10**18),
+        ("1 DAI/day", 10**20 // 86400),
+        ("1/day", 10**20 // 86400),
+        ("200,000 UNI/year", 200_000 * 10**20 // 31_556_952),
+        ("2592000 DAI/month", 10**20),
+        ("1e18/month", 10**38 // 2_592_000),
+        ("1E3 DAI/month", 1000 * 10**20 // 2_592_000),
+    ],
+)
+def test_convert_rate(rate, expected):
+    assert convert_rate(rate) == expected
+
+
+@pytest.mark.parametrize("rate", ["1 DAI/decade", "DAI/day", "1000DAI/month", 1.5])
+def test_convert_rate_invalid(rate):
+    with pytest.raises(ValueError):
+        convert_rate(rate)
+
+
 def test_stream_id(pool, stream):
     stream_id = pool.contract.getStreamId(stream.source, stream.target, stream.rate)
     assert stream.id == stream_id
@@ -30,6 +57,17 @@ def test_stream_send(pool, stream, bird, bee, token, chain):
     assert log.amount > 0
 
 
+def test_stream_send_many(pool, stream, bird, bee, token, chain):
+    pool.deposit("1000 DAI", sender=bird)
+    stream.create(sender=bird)
+    chain.mine()
+    assert stream.balance > 0
+
+    receipt, *_ = pool.send_many([stream], sender=bird)
+    log = next(receipt.decode_logs(pool.token.Transfer))
+    assert log.amount > 0
+
+
 def test_stream_cancel(pool, stream, bird, bee):
     stream.create(sender=bird)
     receipt = stream.cancel(sender=bird)
@@ -57,3 +95,26 @@ def test_stream_modify(pool, bird, bee, stream):
     receipt = stream.modify(rate=stream.rate * 2, sender=bird)
     log = next(receipt.decode_logs(pool.contract.StreamModified))
     assert log.oldAmountPerSec * 2 == log.amountPerSec
+
+
+def test_stream_withdrawable_batch(pool, bird, chain, token, stream):
+    pool.deposit("1000 DAI", sender=bird)
+    stream.create(sender=bird)
+    chain.mine()
+    withdrawable = pool.get_all_withdrawable()
+    assert withdrawable[stream.id] > 0
+
+    result = pool.contract.withdrawable(stream.source, stream.target, stream.rate)
+    assert withdrawable[stream.id] * pool.scale == result.withdrawableAmount
+
+
+def test_stream_withdrawable_batch_active(pool, bird, chain, stream):
+    pool.deposit("1000 DAI", sender=bird)
+    stream.create(sender=bird)
+    cancelled = pool.make_stream(bird, stream.target, stream.rate * 2)
+    cancelled.create(sender=bird)
+    cancelled.cancel(sender=bird)
+    chain.mine()
+    withdrawable = pool.get_all_withdrawable()
+    assert stream.id in withdrawable
+    assert cancelled.id not in withdrawable